@@ -0,0 +1,131 @@
+"""
+Command agent for Command-FS.
+
+The agent runs on a remote host and executes commands on behalf of a
+Command-FS mount. Requests and responses are newline-delimited JSON over a
+TCP or Unix socket, and a single connection serves any number of requests,
+so a mount keeps one open connection per host.
+
+The agent runs arbitrary shell commands: listen on a Unix socket or a
+loopback address and reach it through a tunnel.
+"""
+import argparse
+import json
+import os
+import socket
+import socketserver
+import stat
+import subprocess
+from typing import Any, Dict, Optional, Tuple
+
+
+def parse_address(address: str) -> Tuple[int, Any]:
+    """Parse ``host:port`` or ``[ipv6]:port`` into a TCP address.
+
+    Anything else is taken as a Unix socket path.
+    """
+    if address.startswith('/') or ':' not in address:
+        return socket.AF_UNIX, address
+    host, port = address.rsplit(':', 1)
+    if host.startswith('[') and host.endswith(']'):
+        return socket.AF_INET6, (host[1:-1], int(port))
+    if ':' in host:
+        raise ValueError(f"IPv6 addresses must be bracketed, e.g. [::1]:9000: {address}")
+    return socket.AF_INET, (host, int(port))
+
+
+def run_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute a single agent request and build its response."""
+    command = request.get('command', '')
+    timeout = request.get('timeout', 30)
+    response: Dict[str, Any] = {'id': request.get('id')}
+
+    try:
+        result = subprocess.run(
+            command,
+            shell=True,
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+        response.update(
+            stdout=result.stdout,
+            stderr=result.stderr,
+            returncode=result.returncode
+        )
+    except subprocess.TimeoutExpired:
+        response['error'] = f"Command timed out after {timeout} seconds"
+    except Exception as e:
+        response['error'] = f"Command execution failed: {str(e)}"
+
+    return response
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    """Serve requests from one client connection until it closes."""
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.endswith(b'\n'):
+                # Connection dropped mid-request; never run a truncated request
+                return
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response = {'id': None, 'error': 'Invalid request'}
+            else:
+                response = run_request(request)
+
+            try:
+                self.wfile.write(json.dumps(response).encode() + b'\n')
+            except OSError:
+                # Client gave up on this request (e.g. its timeout expired)
+                return
+
+
+class _UnixAgentServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _TCPAgentServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _TCP6AgentServer(_TCPAgentServer):
+    address_family = socket.AF_INET6
+
+
+def make_server(address: str) -> socketserver.BaseServer:
+    """Create an agent server listening on the given address."""
+    family, addr = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(addr):
+            if not stat.S_ISSOCK(os.stat(addr).st_mode):
+                raise FileExistsError(f"Refusing to replace non-socket file: {addr}")
+            os.unlink(addr)
+        return _UnixAgentServer(addr, AgentHandler)
+    if family == socket.AF_INET6:
+        return _TCP6AgentServer(addr, AgentHandler)
+    return _TCPAgentServer(addr, AgentHandler)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Command-FS agent')
+    parser.add_argument(
+        'address',
+        help='host:port or Unix socket path to listen on'
+    )
+    args = parser.parse_args(argv)
+
+    server = make_server(args.address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
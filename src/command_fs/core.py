@@ -6,25 +6,81 @@ import errno
 import yaml
 import logging
 from datetime import datetime
+from itertools import count
 from typing import Dict, Any, Optional
 import subprocess
 from fuse import FUSE, FuseOSError, Operations, LoggingMixIn
+from .remote import RemotePool, merge_results
 
 logger = logging.getLogger(__name__)
 
+# Top-level names used for the remote command tree
+REMOTE_DIRS = ('hosts', 'all')
+
 class CommandFS(LoggingMixIn, Operations):
     def __init__(self, config_path: str):
         self.config = self._load_config(config_path)
-        # Build filename to command mapping
-        self.files = {}
+        self.remote = RemotePool(self.config.get('hosts') or {})
+        # Output of each open file handle, so chunked reads see one execution
+        self._handles: Dict[int, bytes] = {}
+        self._fh_counter = count(1)
+        # Later commands with the same filename replace earlier ones,
+        # including their remote files
+        top_level: Dict[str, tuple[str, dict]] = {}
         for cmd_name, cmd_info in self.config['commands'].items():
             if cmd_info.get('type') == 'internal':
-                # Special handling for internal commands
-                self.files[f"/{cmd_name}"] = cmd_info
+                top_level[cmd_name] = (cmd_name, cmd_info)
             else:
-                # Regular commands
-                filename = cmd_info.get('filename', cmd_name)
-                self.files[f"/{filename}"] = cmd_info
+                top_level[cmd_info.get('filename', cmd_name)] = (cmd_name, cmd_info)
+
+        # Build filename to command mapping
+        self.files = {}
+        self.dirs: Dict[str, Dict[str, None]] = {'/': {}}
+        for filename, (cmd_name, cmd_info) in top_level.items():
+            self._check_top_level_name(filename)
+            self._add_file(f"/{filename}", cmd_info)
+
+            if cmd_info.get('type') != 'internal':
+                # Remote commands: one file per host plus an aggregated one
+                hosts = self._command_hosts(cmd_name, cmd_info)
+                for host in hosts:
+                    self._add_file(f"/hosts/{host}/{filename}", {**cmd_info, 'host': host})
+                if hosts:
+                    self._add_file(f"/all/{filename}", {**cmd_info, 'fan_out': hosts})
+
+    def _check_top_level_name(self, name: str) -> None:
+        """Reject top-level files that would collide with the remote command tree."""
+        if self.remote.hosts and name in REMOTE_DIRS:
+            raise ValueError(f"Filename '{name}' is reserved when hosts are configured")
+
+    def _add_file(self, path: str, cmd_info: dict) -> None:
+        """Register a command file and any parent directories it needs."""
+        is_new = path not in self.files
+        self.files[path] = cmd_info
+        child = path
+        while is_new and child != '/':
+            parent = os.path.dirname(child)
+            is_new = parent not in self.dirs
+            self.dirs.setdefault(parent, {})[os.path.basename(child)] = None
+            child = parent
+
+    def _command_hosts(self, cmd_name: str, cmd_info: dict) -> list[str]:
+        """Resolve the hosts a command runs on; 'all' means every configured host."""
+        hosts = cmd_info.get('hosts')
+        if not hosts:
+            return []
+        if hosts == 'all':
+            if not self.remote.hosts:
+                raise ValueError(f"Command '{cmd_name}' uses hosts: all but no hosts are configured")
+            return self.remote.hosts
+        if isinstance(hosts, str):
+            hosts = [hosts]
+        if not isinstance(hosts, list):
+            raise ValueError(f"Command '{cmd_name}' hosts must be 'all', a host name or a list of hosts")
+        for host in hosts:
+            if host not in self.remote.hosts:
+                raise ValueError(f"Command '{cmd_name}' references unknown host: {host}")
+        return list(hosts)
 
     def _load_config(self, config_path: str) -> dict:
         """Load command configuration from YAML file."""
@@ -34,8 +90,14 @@ class CommandFS(LoggingMixIn, Operations):
         with open(config_path, 'r') as f:
             return yaml.safe_load(f)
 
-    def _execute_command(self, command: str, timeout: int = 5) -> bytes:
-        """Execute a shell command and return its output."""
+    def _execute_command(self, command: str, timeout: int = 5, host: Optional[str] = None) -> bytes:
+        """Execute a shell command, locally or on a remote host, and return its output."""
+        if host is not None:
+            result = self.remote.run(host, command, timeout)
+            # Like the local path: stdout if the command ran, else the error
+            if result.returncode is None:
+                return (result.error or '').encode()
+            return result.output.encode()
         try:
             result = subprocess.run(
                 command,
@@ -51,16 +113,23 @@ class CommandFS(LoggingMixIn, Operations):
             logger.error(f"Command execution failed: {e}")
             return str(e).encode()
 
+    def _fan_out_command(self, command: str, timeout: int, hosts: list[str]) -> bytes:
+        """Execute a shell command on several hosts in parallel and merge the outputs."""
+        return merge_results(self.remote.fan_out(hosts, command, timeout)).encode()
+
     def _handle_internal_command(self, cmd_name: str) -> bytes:
         """Handle special internal commands."""
         if cmd_name == 'index':
             # Generate list of commands and descriptions
             output = ["Available Commands:", ""]
-            for name, info in self.config['commands'].items():
+            for path, info in self.files.items():
                 if info.get('type') != 'internal':
-                    filename = info.get('filename', name)
                     desc = info.get('description', 'No description')
-                    output.append(f"{filename}: {desc}")
+                    if 'host' in info:
+                        desc = f"{desc} (on {info['host']})"
+                    elif 'fan_out' in info:
+                        desc = f"{desc} (on {', '.join(info['fan_out'])})"
+                    output.append(f"{path[1:]}: {desc}")
             return '\n'.join(output).encode()
         elif cmd_name == 'exit':
             # Handle unmounting - implementation depends on your needs
@@ -79,11 +148,23 @@ class CommandFS(LoggingMixIn, Operations):
                 st_uid=os.getuid(),
                 st_gid=os.getgid()
             )
+        elif path in self.dirs:
+            st = dict(
+                st_mode=(0o555 | 0o040000),  # read-only directory
+                st_nlink=2,
+                st_size=0,
+                st_ctime=0,
+                st_mtime=0,
+                st_atime=0,
+                st_uid=os.getuid(),
+                st_gid=os.getgid()
+            )
         elif path in self.files:
+            output = self._handles.get(fh) if fh is not None else None
             st = dict(
                 st_mode=(0o444 | 0o100000),  # read-only file
                 st_nlink=1,
-                st_size=1024,  # approximate size
+                st_size=len(output) if output is not None else 1024,  # approximate until opened
                 st_ctime=0,
                 st_mtime=0,
                 st_atime=0,
@@ -94,10 +175,8 @@ class CommandFS(LoggingMixIn, Operations):
             raise FuseOSError(errno.ENOENT)
         return st
 
-    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
-        if path not in self.files:
-            raise FuseOSError(errno.ENOENT)
-        
+    def _render(self, path: str) -> bytes:
+        """Produce the full content of a command file."""
         cmd_info = self.files[path]
         
         # Handle internal commands
@@ -107,17 +186,45 @@ class CommandFS(LoggingMixIn, Operations):
             # Execute the command
             command = cmd_info['command']
             timeout = cmd_info.get('timeout', 5)
-            output = self._execute_command(command, timeout)
-        
+            if 'fan_out' in cmd_info:
+                output = self._fan_out_command(command, timeout, cmd_info['fan_out'])
+            else:
+                output = self._execute_command(command, timeout, cmd_info.get('host'))
+        return output
+
+    def open(self, path: str, flags: int) -> int:
+        if path not in self.files:
+            raise FuseOSError(errno.ENOENT)
+        # Execute once per open; every read on this handle slices the same output
+        fh = next(self._fh_counter)
+        self._handles[fh] = self._render(path)
+        return fh
+
+    def read(self, path: str, size: int, offset: int, fh: int) -> bytes:
+        if path not in self.files:
+            raise FuseOSError(errno.ENOENT)
+
+        output = self._handles.get(fh)
+        if output is None:
+            output = self._render(path)
         return output[offset:offset + size]
 
+    def release(self, path: str, fh: int) -> int:
+        self._handles.pop(fh, None)
+        return 0
+
     def readdir(self, path: str, fh: int) -> list[str]:
         dirents = ['.', '..']
-        if path == '/':
-            dirents.extend(name[1:] for name in self.files.keys())
+        dirents.extend(self.dirs.get(path, []))
         return dirents
 
+    def destroy(self, path: str) -> None:
+        """Close remote connections on unmount."""
+        self.remote.close()
+
 
 def mount_fs(mount_point: str, config_path: str) -> None:
     """Mount the Command-FS filesystem."""
-    FUSE(CommandFS(config_path), mount_point, nothreads=True, foreground=True)
+    # direct_io: file sizes are unknown until a command runs, so the kernel
+    # must read until EOF instead of stopping at the reported st_size
+    FUSE(CommandFS(config_path), mount_point, nothreads=True, foreground=True, direct_io=True)
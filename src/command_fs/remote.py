@@ -0,0 +1,302 @@
+"""
+Remote command execution for Command-FS.
+
+Hosts are declared in the ``hosts`` section of the config and reached either
+through a Command-FS agent (see ``agent.py``) over a persistent socket, or
+through ssh with ControlMaster multiplexing. Either way repeated reads reuse
+one connection per host instead of paying connection setup every time.
+"""
+import json
+import logging
+import shlex
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional
+
+from .agent import parse_address
+
+logger = logging.getLogger(__name__)
+
+# Extra time allowed on top of a command's timeout for connection setup and
+# transport overhead before the client gives up on a host.
+TIMEOUT_GRACE = 2
+
+# Exit status of coreutils ``timeout`` when it had to stop the command
+TIMEOUT_EXIT_STATUS = 124
+
+
+class HostResult(NamedTuple):
+    """Result of a command execution on one host.
+
+    ``output`` is always the command's stdout. ``returncode`` is None when
+    the command never produced a process result (timeout, connection failure).
+    """
+    host: str
+    output: str
+    success: bool
+    error: str | None
+    returncode: int | None = None
+
+
+def _process_result(host: str, stdout: str, stderr: str, returncode: int) -> HostResult:
+    """Build a HostResult from a finished process."""
+    if returncode == 0:
+        return HostResult(host, stdout, True, None, returncode)
+    error = f"Command failed with exit code {returncode}"
+    if stderr.strip():
+        error = f"{stderr.rstrip()}\n{error}"
+    return HostResult(host, stdout, False, error, returncode)
+
+
+def _timeout_result(host: str, timeout: float) -> HostResult:
+    return HostResult(host, '', False, f"Command timed out after {timeout} seconds")
+
+
+class AgentConnection:
+    """A persistent connection to a Command-FS agent.
+
+    Every request runs against a single deadline of ``timeout + TIMEOUT_GRACE``
+    covering the wait for the connection, connecting, sending and reading
+    the response.
+    """
+
+    def __init__(self, host: str, address: str):
+        self.host = host
+        self.address = address
+        self._sock: Optional[socket.socket] = None
+        self._buffer = b''
+        self._lock = Lock()
+        self._next_id = 0
+
+    def _remaining(self, deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError
+        return remaining
+
+    def _connect(self, deadline: float) -> None:
+        family, addr = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(self._remaining(deadline))
+        try:
+            sock.connect(addr)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        self._buffer = b''
+
+    def _is_stale(self) -> bool:
+        """Check whether the agent closed an idle connection since the last request."""
+        self._sock.setblocking(False)
+        try:
+            # An idle connection has nothing to read; EOF or stray data means stale
+            self._sock.recv(1, socket.MSG_PEEK)
+            return True
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def _send(self, request: Dict[str, Any], deadline: float) -> None:
+        """Send a request, reconnecting first if needed.
+
+        Only failures before the request is written are retried, so a
+        command is never sent to the agent twice.
+        """
+        if self._sock is not None and self._is_stale():
+            self.close()
+        reused = self._sock is not None
+        payload = json.dumps(request).encode() + b'\n'
+        try:
+            if self._sock is None:
+                self._connect(deadline)
+            self._sock.settimeout(self._remaining(deadline))
+            self._sock.sendall(payload)
+        except TimeoutError:
+            raise
+        except OSError:
+            if not reused:
+                raise
+            self.close()
+            self._connect(deadline)
+            self._sock.settimeout(self._remaining(deadline))
+            self._sock.sendall(payload)
+
+    def _read_line(self, deadline: float) -> bytes:
+        while b'\n' not in self._buffer:
+            self._sock.settimeout(self._remaining(deadline))
+            chunk = self._sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Agent closed the connection")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line
+
+    def run(self, command: str, timeout: float) -> HostResult:
+        """Run a command on the agent within ``timeout`` plus transport grace."""
+        deadline = time.monotonic() + timeout + TIMEOUT_GRACE
+        if not self._lock.acquire(timeout=timeout + TIMEOUT_GRACE):
+            return _timeout_result(self.host, timeout)
+        try:
+            self._next_id += 1
+            request = {'id': self._next_id, 'command': command, 'timeout': timeout}
+            self._send(request, deadline)
+            response = json.loads(self._read_line(deadline))
+        except TimeoutError:
+            # The response may still arrive later, so the stream is unusable
+            self.close()
+            return _timeout_result(self.host, timeout)
+        except (OSError, ValueError) as e:
+            self.close()
+            return HostResult(self.host, '', False, f"Agent connection failed: {str(e)}")
+        finally:
+            self._lock.release()
+
+        if response.get('error'):
+            return HostResult(self.host, '', False, response['error'])
+        return _process_result(
+            self.host,
+            response.get('stdout', ''),
+            response.get('stderr', ''),
+            response.get('returncode', 0)
+        )
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._buffer = b''
+
+
+class SSHConnection:
+    """Run commands over ssh, sharing one multiplexed master connection per host.
+
+    The command's timeout is enforced on the remote host with coreutils
+    ``timeout``; the local ssh process only gets ``TIMEOUT_GRACE`` on top of
+    it to cover connection setup.
+    """
+
+    def __init__(self, host: str, target: str, control_dir: str, persist: int = 60):
+        self.host = host
+        self.target = target
+        self.control_options = [
+            '-o', 'ControlMaster=auto',
+            '-o', f'ControlPath={control_dir}/%C',
+            '-o', f'ControlPersist={persist}',
+        ]
+
+    def run(self, command: str, timeout: float) -> HostResult:
+        remote_command = f"timeout {timeout} sh -c {shlex.quote(command)}"
+        try:
+            result = subprocess.run(
+                ['ssh', '-o', 'BatchMode=yes', *self.control_options,
+                 self.target, '--', remote_command],
+                capture_output=True,
+                text=True,
+                timeout=timeout + TIMEOUT_GRACE
+            )
+        except subprocess.TimeoutExpired:
+            return _timeout_result(self.host, timeout)
+        except Exception as e:
+            return HostResult(self.host, '', False, f"Command execution failed: {str(e)}")
+        if result.returncode == TIMEOUT_EXIT_STATUS:
+            return _timeout_result(self.host, timeout)
+        return _process_result(self.host, result.stdout, result.stderr, result.returncode)
+
+    def close(self) -> None:
+        """Shut down the master connection, if one was started."""
+        subprocess.run(
+            ['ssh', *self.control_options, '-O', 'exit', self.target],
+            capture_output=True
+        )
+
+
+class RemotePool:
+    """Persistent connections to the hosts declared in the ``hosts`` config section."""
+
+    def __init__(self, hosts: Dict[str, Dict[str, Any]], max_workers: int = 16):
+        self._connections: Dict[str, AgentConnection | SSHConnection] = {}
+        self._timeouts: Dict[str, float] = {}
+        self._control_dir: Optional[str] = None
+
+        if not isinstance(hosts, dict):
+            raise ValueError("The hosts section must map host names to their settings")
+        for name, info in hosts.items():
+            if not isinstance(name, str) or name in ('', '.', '..') or '/' in name:
+                raise ValueError(f"Invalid host name: {name!r}")
+            info = info or {}
+            if not isinstance(info, dict):
+                raise ValueError(f"Host '{name}' settings must be a mapping")
+            if 'agent' in info:
+                self._connections[name] = AgentConnection(name, info['agent'])
+            elif 'ssh' in info:
+                if self._control_dir is None:
+                    self._control_dir = tempfile.mkdtemp(prefix='command-fs-ssh-')
+                self._connections[name] = SSHConnection(
+                    name, info['ssh'], self._control_dir, info.get('persist', 60)
+                )
+            else:
+                raise ValueError(f"Host '{name}' must define either 'agent' or 'ssh'")
+            if 'timeout' in info:
+                self._timeouts[name] = info['timeout']
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(self._connections))),
+            thread_name_prefix='command-fs-remote'
+        )
+
+    @property
+    def hosts(self) -> list[str]:
+        return list(self._connections)
+
+    def run(self, host: str, command: str, timeout: float = 5) -> HostResult:
+        """Run a command on one host; the host's own timeout wins if configured."""
+        timeout = self._timeouts.get(host, timeout)
+        try:
+            return self._connections[host].run(command, timeout)
+        except Exception as e:
+            logger.error(f"Remote execution on {host} failed: {e}")
+            return HostResult(host, '', False, str(e))
+
+    def fan_out(self, hosts: Iterable[str], command: str, timeout: float = 5) -> Iterator[HostResult]:
+        """Run a command on several hosts in parallel, yielding results as they finish.
+
+        Each host is bounded by its own connection deadline, so there is no
+        overall timeout here: every submitted run has finished by the time
+        the last result is yielded and no work is left holding a connection.
+        """
+        futures = [
+            self._executor.submit(self.run, host, command, timeout)
+            for host in hosts
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def close(self) -> None:
+        """Close all connections and stop the worker threads."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for connection in self._connections.values():
+            try:
+                connection.close()
+            except Exception as e:
+                logger.error(f"Failed to close connection to {connection.host}: {e}")
+        if self._control_dir is not None:
+            shutil.rmtree(self._control_dir, ignore_errors=True)
+            self._control_dir = None
+
+
+def merge_results(results: Iterable[HostResult]) -> str:
+    """Merge per-host results into one listing, in the order they arrive."""
+    sections = []
+    for result in results:
+        body = result.output.rstrip()
+        if not result.success:
+            body = '\n'.join(part for part in (body, result.error) if part)
+        sections.append(f"==> {result.host} <==\n{body}\n")
+    return '\n'.join(sections)
@@ -0,0 +1,28 @@
+"""Shared fixtures for Command-FS tests."""
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+import pytest
+import command_fs
+
+
+@pytest.fixture
+def agent_socket(tmp_path):
+    """Start a Command-FS agent process listening on a Unix socket."""
+    socket_path = tmp_path / 'agent.sock'
+    env = dict(os.environ, PYTHONPATH=str(Path(command_fs.__file__).parents[1]))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'command_fs.agent', str(socket_path)],
+        env=env
+    )
+    try:
+        for _ in range(100):
+            if socket_path.exists():
+                break
+            time.sleep(0.05)
+        yield str(socket_path)
+    finally:
+        process.terminate()
+        process.wait()
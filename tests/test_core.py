@@ -0,0 +1,163 @@
+"""Tests for the CommandFS tree and reads, with the fuse bindings stubbed out."""
+import errno
+import importlib
+import os
+import sys
+import types
+import pytest
+import yaml
+
+
+@pytest.fixture
+def core(monkeypatch):
+    """Import command_fs.core against a stand-in fuse module (no libfuse needed)."""
+    fuse = types.ModuleType('fuse')
+
+    class FuseOSError(OSError):
+        def __init__(self, errno):
+            super().__init__(errno, os.strerror(errno))
+
+    fuse.FuseOSError = FuseOSError
+    fuse.Operations = type('Operations', (), {})
+    fuse.LoggingMixIn = type('LoggingMixIn', (), {})
+    fuse.FUSE = lambda *args, **kwargs: None
+    monkeypatch.setitem(sys.modules, 'fuse', fuse)
+    sys.modules.pop('command_fs.core', None)
+    try:
+        yield importlib.import_module('command_fs.core')
+    finally:
+        sys.modules.pop('command_fs.core', None)
+
+
+def make_fs(core, tmp_path, config):
+    config_path = tmp_path / 'commands.yaml'
+    config_path.write_text(yaml.safe_dump(config))
+    return core.CommandFS(str(config_path))
+
+
+def remote_config(agent_socket, **commands):
+    return {
+        'hosts': {
+            'h1': {'agent': agent_socket},
+            'h2': {'agent': agent_socket},
+        },
+        'commands': {
+            'index': {'type': 'internal'},
+            'local': {'command': 'echo local'},
+            **commands,
+        },
+    }
+
+
+def test_remote_tree(core, tmp_path, agent_socket):
+    """Test the hosts/<host>/<file> and all/<file> directories."""
+    fs = make_fs(core, tmp_path, remote_config(
+        agent_socket,
+        up={'filename': 'uptime', 'command': 'echo up', 'hosts': 'all'},
+        who={'command': 'echo who', 'hosts': 'h2'},
+    ))
+    try:
+        assert fs.readdir('/', 0) == ['.', '..', 'index', 'local', 'uptime', 'hosts', 'all', 'who']
+        assert fs.readdir('/hosts', 0) == ['.', '..', 'h1', 'h2']
+        assert fs.readdir('/hosts/h1', 0) == ['.', '..', 'uptime']
+        assert fs.readdir('/hosts/h2', 0) == ['.', '..', 'uptime', 'who']
+        assert fs.readdir('/all', 0) == ['.', '..', 'uptime', 'who']
+
+        for path in ('/hosts', '/hosts/h1', '/all'):
+            assert fs.getattr(path)['st_mode'] == 0o555 | 0o040000
+        assert fs.getattr('/all/uptime')['st_mode'] == 0o444 | 0o100000
+        with pytest.raises(OSError) as excinfo:
+            fs.getattr('/hosts/h1/who')
+        assert excinfo.value.errno == errno.ENOENT
+    finally:
+        fs.destroy('/')
+
+
+def test_remote_reads(core, tmp_path, agent_socket):
+    """Test reads dispatched to one host and fanned out to all of them."""
+    fs = make_fs(core, tmp_path, remote_config(
+        agent_socket,
+        up={'filename': 'uptime', 'command': 'echo up', 'hosts': ['h1', 'h2']},
+        fail={'command': 'echo partial; exit 2', 'hosts': 'all'},
+    ))
+    try:
+        assert fs.read('/hosts/h2/uptime', 1024, 0, 0) == b'up\n'
+        # Same content rule as a local read: stdout, even on failure
+        assert fs.read('/hosts/h1/fail', 1024, 0, 0) == b'partial\n'
+
+        merged = fs.read('/all/uptime', 1024, 0, 0).decode()
+        assert '==> h1 <==\nup\n' in merged
+        assert '==> h2 <==\nup\n' in merged
+    finally:
+        fs.destroy('/')
+
+
+def test_open_runs_command_once(core, tmp_path, agent_socket):
+    """Test that chunked reads on one handle share a single execution."""
+    fs = make_fs(core, tmp_path, remote_config(
+        agent_socket,
+        counter={'command': f'echo x >> {tmp_path}/runs; wc -l < {tmp_path}/runs', 'hosts': 'all'},
+    ))
+    try:
+        fh = fs.open('/all/counter', os.O_RDONLY)
+        size = fs.getattr('/all/counter', fh)['st_size']
+        chunks = b''.join(fs.read('/all/counter', 4, offset, fh) for offset in range(0, size, 4))
+        fs.release('/all/counter', fh)
+
+        assert len(chunks) == size
+        assert (tmp_path / 'runs').read_text().count('x') == 2
+    finally:
+        fs.destroy('/')
+
+
+def test_duplicate_filenames_listed_once(core, tmp_path):
+    """Test that commands sharing a filename appear once in the listing."""
+    fs = make_fs(core, tmp_path, {'commands': {
+        'a': {'filename': 'uptime', 'command': 'echo a'},
+        'b': {'filename': 'uptime', 'command': 'echo b'},
+    }})
+    assert fs.readdir('/', 0) == ['.', '..', 'uptime']
+    assert fs.read('/uptime', 1024, 0, 0) == b'b\n'
+
+
+def test_redefined_filename_replaces_remote_files(core, tmp_path, agent_socket):
+    """Test that redefining a filename drops the earlier command's remote files."""
+    config = remote_config(agent_socket)
+    config['commands']['a'] = {'filename': 'up', 'command': 'echo a', 'hosts': ['h1']}
+    config['commands']['b'] = {'filename': 'up', 'command': 'echo b'}
+    fs = make_fs(core, tmp_path, config)
+    try:
+        assert fs.read('/up', 1024, 0, 0) == b'b\n'
+        assert 'hosts' not in fs.readdir('/', 0)
+        assert '/hosts/h1/up' not in fs.files
+        assert '/all/up' not in fs.files
+    finally:
+        fs.destroy('/')
+
+
+def test_index_lists_remote_files(core, tmp_path, agent_socket):
+    """Test that the index shows remote files and the hosts they run on."""
+    fs = make_fs(core, tmp_path, remote_config(
+        agent_socket,
+        up={'filename': 'uptime', 'description': 'Uptime', 'command': 'uptime', 'hosts': 'all'},
+    ))
+    try:
+        index = fs.read('/index', 4096, 0, 0).decode().splitlines()
+        assert 'uptime: Uptime' in index
+        assert 'hosts/h1/uptime: Uptime (on h1)' in index
+        assert 'hosts/h2/uptime: Uptime (on h2)' in index
+        assert 'all/uptime: Uptime (on h1, h2)' in index
+    finally:
+        fs.destroy('/')
+
+
+def test_reserved_and_invalid_hosts(core, tmp_path, agent_socket):
+    """Test config errors for the remote tree."""
+    with pytest.raises(ValueError, match="reserved"):
+        make_fs(core, tmp_path, remote_config(agent_socket, hosts={'command': 'echo'}))
+    with pytest.raises(ValueError, match="unknown host: web9"):
+        make_fs(core, tmp_path, remote_config(agent_socket, up={'command': 'echo', 'hosts': 'web9'}))
+    with pytest.raises(ValueError, match="list of hosts"):
+        make_fs(core, tmp_path, remote_config(agent_socket, up={'command': 'echo', 'hosts': {'h1': 1}}))
+    with pytest.raises(ValueError, match="no hosts are configured"):
+        make_fs(core, tmp_path, {'commands': {'up': {'command': 'echo', 'hosts': 'all'}}})
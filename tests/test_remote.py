@@ -0,0 +1,185 @@
+"""Tests for remote execution through a local stand-in agent."""
+import os
+import socket
+import time
+import pytest
+from command_fs.agent import make_server, parse_address
+from command_fs.remote import RemotePool, merge_results
+
+# Stand-in for ssh: logs its arguments, then runs whatever follows "--"
+FAKE_SSH = """#!/bin/sh
+printf '%s\\n' "$@" >> "$SSH_LOG"
+echo ---- >> "$SSH_LOG"
+while [ $# -gt 0 ]; do
+    if [ "$1" = "--" ]; then
+        shift
+        exec sh -c "$1"
+    fi
+    shift
+done
+"""
+
+
+@pytest.fixture
+def fake_ssh(tmp_path, monkeypatch):
+    """Put a fake ssh on PATH and return the file its invocations are logged to."""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    ssh = bin_dir / 'ssh'
+    ssh.write_text(FAKE_SSH)
+    ssh.chmod(0o755)
+    log = tmp_path / 'ssh.log'
+    monkeypatch.setenv('PATH', f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv('SSH_LOG', str(log))
+    return log
+
+
+def test_agent_run_reuses_connection(agent_socket):
+    """Test that repeated runs on a host share one agent connection."""
+    pool = RemotePool({'local': {'agent': agent_socket}})
+    try:
+        result = pool.run('local', 'echo first')
+        assert result.success
+        assert result.output == 'first\n'
+
+        sock = pool._connections['local']._sock
+        assert sock is not None
+
+        result = pool.run('local', 'echo second')
+        assert result.output == 'second\n'
+        assert pool._connections['local']._sock is sock
+    finally:
+        pool.close()
+
+
+def test_agent_run_failure(agent_socket):
+    """Test that a failing remote command reports its exit code."""
+    pool = RemotePool({'local': {'agent': agent_socket}})
+    try:
+        result = pool.run('local', 'echo out; echo oops >&2; exit 3')
+        assert not result.success
+        assert result.returncode == 3
+        assert result.output == 'out\n'
+        assert result.error == 'oops\nCommand failed with exit code 3'
+    finally:
+        pool.close()
+
+
+def test_fan_out_per_host_timeout(agent_socket):
+    """Test that a slow host times out without holding back the others."""
+    pool = RemotePool({
+        'fast': {'agent': agent_socket},
+        'slow': {'agent': agent_socket, 'timeout': 1},
+    })
+    try:
+        start = time.time()
+        results = list(pool.fan_out(pool.hosts, 'sleep 2; echo done', timeout=10))
+        assert time.time() - start < 5
+
+        # Results arrive in completion order
+        assert [r.host for r in results] == ['slow', 'fast']
+        assert 'timed out' in results[0].error
+        assert results[1].output == 'done\n'
+
+        # The timed-out host recovers on the next request
+        assert pool.run('slow', 'echo back').output == 'back\n'
+    finally:
+        pool.close()
+
+
+def test_fan_out_unreachable_host(agent_socket, tmp_path):
+    """Test that an unreachable host is reported in the merged output."""
+    pool = RemotePool({
+        'up': {'agent': agent_socket},
+        'down': {'agent': str(tmp_path / 'missing.sock')},
+    })
+    try:
+        merged = merge_results(pool.fan_out(pool.hosts, 'echo hello'))
+        assert '==> up <==\nhello\n' in merged
+        assert '==> down <==\nAgent connection failed' in merged
+    finally:
+        pool.close()
+
+
+def test_host_requires_transport():
+    """Test that hosts without an agent or ssh target are rejected."""
+    with pytest.raises(ValueError):
+        RemotePool({'broken': {'timeout': 5}})
+
+
+def test_agent_reconnects_after_restart(agent_socket):
+    """Test that a connection closed by the agent is replaced before sending."""
+    pool = RemotePool({'local': {'agent': agent_socket}})
+    try:
+        assert pool.run('local', 'echo one').success
+        # Simulate the agent dropping the idle connection
+        pool._connections['local']._sock.shutdown(2)
+        result = pool.run('local', 'echo two')
+        assert result.output == 'two\n'
+    finally:
+        pool.close()
+
+
+def test_make_server_keeps_regular_file(tmp_path):
+    """Test that the agent refuses to replace a file that is not a socket."""
+    path = tmp_path / 'notes.txt'
+    path.write_text('keep me')
+    with pytest.raises(FileExistsError):
+        make_server(str(path))
+    assert path.read_text() == 'keep me'
+
+
+def test_ssh_run_uses_control_master(fake_ssh):
+    """Test the ssh command line and that close() stops the master."""
+    pool = RemotePool({'web': {'ssh': 'deploy@web'}})
+    control_dir = pool._control_dir
+    result = pool.run('web', "echo 'it works'; exit 0")
+    pool.close()
+
+    assert result.success
+    assert result.output == 'it works\n'
+
+    run_args, exit_args = fake_ssh.read_text().split('----\n')[:2]
+    run_args = run_args.splitlines()
+    assert run_args[:2] == ['-o', 'BatchMode=yes']
+    assert 'ControlMaster=auto' in run_args
+    assert f'ControlPath={control_dir}/%C' in run_args
+    assert run_args[-3] == 'deploy@web'
+    assert run_args[-2] == '--'
+    assert run_args[-1].startswith('timeout 5 sh -c ')
+
+    exit_args = exit_args.splitlines()
+    assert exit_args[-3:] == ['-O', 'exit', 'deploy@web']
+    assert f'ControlPath={control_dir}/%C' in exit_args
+
+
+def test_ssh_enforces_host_timeout(fake_ssh):
+    """Test that an ssh host's timeout is enforced on the remote command."""
+    pool = RemotePool({'web': {'ssh': 'deploy@web', 'timeout': 1}})
+    try:
+        start = time.time()
+        result = pool.run('web', 'sleep 2.8; echo ran', timeout=10)
+        assert time.time() - start < 2
+        assert not result.success
+        assert result.output == ''
+        assert result.error == 'Command timed out after 1 seconds'
+    finally:
+        pool.close()
+
+
+def test_invalid_hosts_section():
+    """Test that malformed hosts sections and host names are rejected."""
+    with pytest.raises(ValueError, match="must map host names"):
+        RemotePool(['web1', 'web2'])
+    for name in ('a/b', '.', '..', ''):
+        with pytest.raises(ValueError, match="Invalid host name"):
+            RemotePool({name: {'agent': '/tmp/agent.sock'}})
+
+
+def test_parse_address():
+    """Test TCP, bracketed IPv6 and Unix socket agent addresses."""
+    assert parse_address('web1:7070') == (socket.AF_INET, ('web1', 7070))
+    assert parse_address('[::1]:9000') == (socket.AF_INET6, ('::1', 9000))
+    assert parse_address('/run/agent.sock') == (socket.AF_UNIX, '/run/agent.sock')
+    with pytest.raises(ValueError):
+        parse_address('::1:9000')